@@ -32,6 +32,9 @@
 // Stack grows down from top of data memory
 `define STACK_TOP           32'h100FFFFF
 
+// Software writes 1 to this byte to signal that it has finished (simulation only)
+`define CPU_DONE_ADDR       32'h100000FF
+
 // Reserved regions for future peripherals
 `define PERIPH_BASE         32'h20000000
 `define PERIPH_SIZE         32'h10000000  // 256MB region
@@ -17,13 +17,21 @@ module instr_mem #(
 reg [DATA_WIDTH-1:0] instr_ram [0:MEM_SIZE-1];
 
 `ifdef COCOTB_SIM
+// +instr_hex=<file> selects the program at run time so one build can be
+// shared by several programs; the INSTR_HEX_FILE define is the fallback.
+reg [8*512-1:0] instr_hex_file;
 initial begin
+    if ($value$plusargs("instr_hex=%s", instr_hex_file)) begin
+        $display("Loading instruction memory from file: %0s", instr_hex_file);
+        $readmemh(instr_hex_file, instr_ram);
+    end else begin
     `ifdef INSTR_HEX_FILE
         $display("Loading instruction memory from file: %s", `INSTR_HEX_FILE);
         $readmemh(`INSTR_HEX_FILE, instr_ram);
     `else
         $display("No instruction file specified, initializing memory with NOPs.");
     `endif
+    end
     // Debug: Print first few instructions after loading
     // $display("Instruction memory loaded - first few entries:");
     // $display("  [0x00]: 0x%08h", instr_ram[0]);
@@ -143,20 +143,29 @@ module top (
     );
 
 `ifdef COCOTB_SIM
-    // Add parameter to control FST file path
-    reg [1023:0] dumpfile_path = "riscv_cpu.fst"; // Default path
+    // Completion strobe for testbenches: pulses for one cycle after software
+    // writes 1 to CPU_DONE_ADDR, so a test can await a single edge instead
+    // of sampling the memory bus every clock
+    reg cpu_done;
+    always @(posedge clk) begin
+        if (rst)
+            cpu_done <= 1'b0;
+        else
+            cpu_done <= cpu_mem_write_en &&
+                        (cpu_mem_write_addr == `CPU_DONE_ADDR) &&
+                        (cpu_mem_write_data[7:0] == 8'h01);
+    end
+
+    // Wave dumping is only enabled when a file is given with +dumpfile=<path>,
+    // since dumping the whole hierarchy dominates simulation time
+    reg [1023:0] dumpfile_path;
     
     initial begin
-        // Check for custom dump file name from plusargs
-        if (!$value$plusargs("dumpfile=%s", dumpfile_path)) begin
-            // Use default if not specified
-            dumpfile_path = "riscv_cpu.fst";
+        if ($value$plusargs("dumpfile=%s", dumpfile_path)) begin
+            $dumpfile(dumpfile_path);
+            $dumpvars(0, top);
+            $display("FST dump file: %s", dumpfile_path);
         end
-        
-        // Set up wave dumping
-        $dumpfile(dumpfile_path);
-        $dumpvars(0, top);
-        $display("FST dump file: %s", dumpfile_path);
     end
 `endif
 
@@ -22,7 +22,30 @@ ifndef INSTRUCTION_MEMORY_HEX
 $(echo "Error: INSTRUCTION_MEMORY_HEX is not set. Please define it in your environment or Makefile.")
 endif
 
-# Optional: Any additional compile flags (Add trace and instruction memory hex file from environment variable)
-EXTRA_ARGS += --trace -DINSTR_HEX_FILE=\"$(INSTRUCTION_MEMORY_HEX)\"
+# Optional: Any additional compile flags (Add instruction memory hex file from environment variable)
+EXTRA_ARGS += -DINSTR_HEX_FILE=\"$(INSTRUCTION_MEMORY_HEX)\"
+
+# Build an optimised model by default; waveform tracing roughly halves
+# simulation speed, so only enable it on request (TRACE=1)
+EXTRA_ARGS += -O3 --x-assign fast --x-initial fast --noassert
+# Also compile the generated C++ at -O3; the C programs run for millions of
+# cycles, so the longer build pays for itself
+EXTRA_ARGS += -CFLAGS -O3
+ifeq ($(TRACE),1)
+EXTRA_ARGS += --trace-fst
+PLUSARGS += +dumpfile=riscv_cpu.fst
+# Trace only the top-level signals by default; set TRACE_DEPTH to a larger
+# number of levels, or to empty (TRACE_DEPTH=) for the whole hierarchy
+TRACE_DEPTH ?= 1
+ifneq ($(TRACE_DEPTH),)
+EXTRA_ARGS += --trace-depth $(TRACE_DEPTH)
+endif
+endif
+
+# Optional: multithreaded model (e.g. THREADS=2). Off by default since the
+# core is small enough that thread synchronisation can outweigh the gain
+ifdef THREADS
+EXTRA_ARGS += --threads $(THREADS)
+endif
 
 include $(shell cocotb-config --makefiles)/Makefile.sim
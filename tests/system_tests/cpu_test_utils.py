@@ -0,0 +1,96 @@
+"""Paths and helpers shared by the system tests"""
+import os
+import cocotb
+from cocotb.triggers import RisingEdge, ClockCycles
+from cocotb.clock import Clock
+
+# Repository locations, resolved once at import rather than on every runner call
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+RTL_DIR = os.path.join(REPO_DIR, "rtl")
+INCL_DIR = os.path.join(RTL_DIR, "include")
+SIM_DIR = os.path.join(REPO_DIR, "sim")
+
+# Every test that builds the CPU compiles this same source list
+RTL_SOURCES = [
+    os.path.join(root, file)
+    for root, _, files in os.walk(RTL_DIR)
+    for file in files
+    if file.endswith(".v") or file.endswith(".sv")
+]
+RTL_HEADERS = [os.path.join(INCL_DIR, file) for file in os.listdir(INCL_DIR) if file.endswith(".vh")]
+
+async def start_clock_and_reset(dut):
+    """Start the clock, clear riscv_cpu's instruction/data buses and reset it"""
+    clock = Clock(dut.clk, 10, units="ns")
+    cocotb.start_soon(clock.start())
+
+    dut.module_instr_in.value = 0
+    dut.module_read_data_in.value = 0
+    dut.rst.value = 1
+    await ClockCycles(dut.clk, 2)
+    dut.rst.value = 0
+    await RisingEdge(dut.clk)
+
+def check_register_values(dut, expected_values):
+    """Assert that the register file holds the expected values"""
+    register_file = dut.rf_inst0.register_file
+    for reg, expected in expected_values.items():
+        actual = int(register_file[reg].value)
+        assert actual == expected, f"Register x{reg} value mismatch: expected {expected:#x}, got {actual:#x}"
+    print(f"{len(expected_values)} register values match")
+
+# Waveforms are only dumped on request (COCOTB_WAVES=1)
+WAVES = os.environ.get("COCOTB_WAVES") == "1"
+
+def waveform_plusargs(name):
+    """The +dumpfile plusarg for top's own dump code, or none when waves are off"""
+    if not WAVES:
+        return []
+    waveform_dir = os.path.join(os.getcwd(), "waveforms")
+    os.makedirs(waveform_dir, exist_ok=True)
+    return [f"+dumpfile={os.path.join(waveform_dir, f'{name}.vcd')}"]
+
+def run_cocotb(module, toplevel, tests, build_name, simulator="icarus", plus_args=(), extra_args=(), waves=False):
+    """Run the named cocotb tests from module in a single simulator process
+
+    Test files that need a fresh program per test parametrize their
+    runCocotbTests() over their tests so pytest-xdist can spread the runs over
+    workers (pytest -n auto), and each worker builds into its own directory. Files that pass the same build_name
+    share one build of toplevel, and select what to run with plus_args, so the
+    simulator is only recompiled when the RTL changes. Set waves to have the
+    simulator trace a toplevel that has no dump code of its own.
+    """
+    # Imported here so the simulator-side import of the test modules skips cocotb_test
+    from cocotb_test.simulator import run
+    
+    # A traced model is built with extra dump code, and cocotb-test doesn't
+    # rebuild when waves is toggled, so it gets a build directory of its own
+    if waves:
+        build_name += "_waves"
+    worker = os.environ.get("PYTEST_XDIST_WORKER", "")
+    sim_build = os.path.join(os.getcwd(), "sim_build", f"{build_name}{worker}")
+    
+    # cocotb-test only rebuilds an Icarus model when a .v source is newer than
+    # it, so also rebuild when one of the rtl/include headers has changed
+    force_compile = False
+    vvp = os.path.join(sim_build, f"{toplevel}.vvp")
+    if simulator == "icarus" and os.path.isfile(vvp):
+        built = os.path.getmtime(vvp)
+        force_compile = any(os.path.getmtime(header) > built for header in RTL_HEADERS)
+    
+    print(f"Using RTL directory: {RTL_DIR}")
+    print(f"\n=== Running {', '.join(tests)} ===")
+    run(
+        verilog_sources=RTL_SOURCES,
+        toplevel=toplevel,
+        module=module,
+        testcase=",".join(tests),
+        includes=[INCL_DIR],
+        simulator=simulator,
+        timescale="1ns/1ps",
+        plus_args=list(plus_args),
+        extra_args=list(extra_args),
+        waves=waves,
+        sim_build=sim_build,
+        force_compile=force_compile,
+    )
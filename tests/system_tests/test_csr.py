@@ -1,6 +1,6 @@
 import cocotb
-from cocotb.triggers import RisingEdge, Timer
-from cocotb.clock import Clock
+from cocotb.triggers import RisingEdge
+from cpu_test_utils import WAVES, run_cocotb, start_clock_and_reset, check_register_values
 import pytest
 
 async def run_csr_test_program(dut, instr_mem):
@@ -15,34 +15,54 @@ async def run_csr_test_program(dut, instr_mem):
             return instr_mem[idx]
         return 0
     
+    # Bind the fetch handles once; the instruction bus is only re-driven when
+    # the fetched word changes, so stalled cycles don't schedule a write
+    pc_out = dut.module_pc_out
+    instr_in = dut.module_instr_in
+    driven_instr = None
+
+    # Resolve the monitored handles once instead of on every cycle
+    rd_in = dut.rf_inst0_rd_in
+    rd_value_in = dut.rf_inst0_rd_value_in
+    wr_en = dut.rf_inst0_wr_en
+    csr_addr_sig = dut.csr_addr
+    csr_read_enable = dut.csr_read_enable
+    csr_write_enable = dut.csr_write_enable
+    csr_read_data_sig = dut.csr_read_data
+    csr_write_data_sig = dut.csr_write_data
+    clk_edge = RisingEdge(dut.clk)
+
     # Feed instructions and track CSR operations
     for cycle in range(len(instr_mem) + 10):  # Run for enough cycles
         # Feed instruction based on PC
-        pc = int(dut.module_pc_out.value)
+        pc = int(pc_out.value)
         current_instr = get_instr(pc)
-        dut.module_instr_in.value = current_instr
+        if current_instr != driven_instr:
+            instr_in.value = current_instr
+            driven_instr = current_instr
         
-        # Track register writes
+        # Track register writes; the destination and value are only read
+        # on cycles that actually write back
         try:
-            wb_reg = int(dut.rf_inst0_rd_in.value)
-            wb_val = int(dut.rf_inst0_rd_value_in.value)
-            wb_en = int(dut.rf_inst0_wr_en.value)
-            
-            if wb_en and wb_reg != 0:
-                reg_values[wb_reg] = wb_val
-                print(f"Cycle {cycle}: Register x{wb_reg} = {wb_val:#x}")
+            if int(wr_en.value):
+                wb_reg = int(rd_in.value)
+                if wb_reg != 0:
+                    wb_val = int(rd_value_in.value)
+                    reg_values[wb_reg] = wb_val
+                    print(f"Cycle {cycle}: Register x{wb_reg} = {wb_val:#x}")
         except Exception as e:
             print(f"Error tracking registers: {e}")
         
-        # Track CSR operations
+        # Track CSR operations; the address and data are only read on cycles
+        # with a CSR access
         try:
-            csr_addr = int(dut.csr_addr.value)
-            csr_read_en = int(dut.csr_read_enable.value)
-            csr_write_en = int(dut.csr_write_enable.value)
-            csr_read_data = int(dut.csr_read_data.value)
-            csr_write_data = int(dut.csr_write_data.value)
+            csr_read_en = int(csr_read_enable.value)
+            csr_write_en = int(csr_write_enable.value)
             
             if csr_read_en or csr_write_en:
+                csr_addr = int(csr_addr_sig.value)
+                csr_read_data = int(csr_read_data_sig.value)
+                csr_write_data = int(csr_write_data_sig.value)
                 operation = ""
                 if csr_read_en and csr_write_en:
                     operation = f"CSR RW: CSR[{csr_addr:#x}] read={csr_read_data:#x}, write={csr_write_data:#x}"
@@ -56,7 +76,7 @@ async def run_csr_test_program(dut, instr_mem):
             pass
             
         # Advance simulation
-        await RisingEdge(dut.clk)
+        await clk_edge
         
     # Print final register values
     print("\nFinal register values:")
@@ -71,17 +91,7 @@ async def test_csr_basic_operations(dut):
     """Test basic CSR read/write operations"""
     print("Starting CSR basic operations test...")
     
-    # Attach a clock
-    clock = Clock(dut.clk, 10, units="ns")
-    cocotb.start_soon(clock.start())
-
-    # Reset
-    dut.module_instr_in.value = 0
-    dut.module_read_data_in.value = 0
-    dut.rst.value = 1
-    await Timer(20, units="ns")
-    dut.rst.value = 0
-    await RisingEdge(dut.clk)
+    await start_clock_and_reset(dut)
 
     # Program to test CSR operations:
     instr_mem = [
@@ -124,10 +134,7 @@ async def test_csr_basic_operations(dut):
     
     # Verify register values
     print("\nVerifying register values:")
-    for reg, expected in expected_values.items():
-        actual = int(dut.rf_inst0.register_file[reg].value)
-        print(f"x{reg}: expected={expected:#x}, actual={actual:#x}")
-        assert actual == expected, f"Register x{reg} value mismatch: expected {expected:#x}, got {actual:#x}"
+    check_register_values(dut, expected_values)
     
     # Check final CSR value
     final_mscratch = int(dut.csr_file_inst.mscratch.value)
@@ -142,16 +149,7 @@ async def test_csr_mstatus_operations(dut):
     """Test operations on MSTATUS CSR"""
     print("Starting MSTATUS CSR test...")
     
-    clock = Clock(dut.clk, 10, units="ns")
-    cocotb.start_soon(clock.start())
-
-    # Reset
-    dut.module_instr_in.value = 0
-    dut.module_read_data_in.value = 0
-    dut.rst.value = 1
-    await Timer(20, units="ns")
-    dut.rst.value = 0
-    await RisingEdge(dut.clk)
+    await start_clock_and_reset(dut)
 
     # Program to test MSTATUS operations:
     instr_mem = [
@@ -186,10 +184,7 @@ async def test_csr_mstatus_operations(dut):
     }
     
     print("\nVerifying MSTATUS register values:")
-    for reg, expected in expected_values.items():
-        actual = int(dut.rf_inst0.register_file[reg].value)
-        print(f"x{reg}: expected={expected:#x}, actual={actual:#x}")
-        assert actual == expected, f"Register x{reg} value mismatch: expected {expected:#x}, got {actual:#x}"
+    check_register_values(dut, expected_values)
     
     print("MSTATUS CSR test passed!")
 
@@ -198,16 +193,7 @@ async def test_csr_cycle_counter(dut):
     """Test cycle counter CSRs"""
     print("Starting cycle counter CSR test...")
     
-    clock = Clock(dut.clk, 10, units="ns")
-    cocotb.start_soon(clock.start())
-
-    # Reset
-    dut.module_instr_in.value = 0
-    dut.module_read_data_in.value = 0
-    dut.rst.value = 1
-    await Timer(20, units="ns")
-    dut.rst.value = 0
-    await RisingEdge(dut.clk)
+    await start_clock_and_reset(dut)
 
     # Program to test cycle counter:
     instr_mem = [
@@ -229,10 +215,11 @@ async def test_csr_cycle_counter(dut):
     await run_csr_test_program(dut, instr_mem)
     
     # Verify that cycle counter is advancing
-    cycle_low_1 = int(dut.rf_inst0.register_file[2].value)
-    cycle_high_1 = int(dut.rf_inst0.register_file[4].value)
-    cycle_low_2 = int(dut.rf_inst0.register_file[6].value)
-    cycle_high_2 = int(dut.rf_inst0.register_file[8].value)
+    register_file = dut.rf_inst0.register_file
+    cycle_low_1 = int(register_file[2].value)
+    cycle_high_1 = int(register_file[4].value)
+    cycle_low_2 = int(register_file[6].value)
+    cycle_high_2 = int(register_file[8].value)
     
     print(f"First cycle read: low={cycle_low_1:#x}, high={cycle_high_1:#x}")
     print(f"Second cycle read: low={cycle_low_2:#x}, high={cycle_high_2:#x}")
@@ -247,16 +234,7 @@ async def test_csr_invalid_access(dut):
     """Test access to invalid CSR addresses"""
     print("Starting invalid CSR access test...")
     
-    clock = Clock(dut.clk, 10, units="ns")
-    cocotb.start_soon(clock.start())
-
-    # Reset
-    dut.module_instr_in.value = 0
-    dut.module_read_data_in.value = 0
-    dut.rst.value = 1
-    await Timer(20, units="ns")
-    dut.rst.value = 0
-    await RisingEdge(dut.clk)
+    await start_clock_and_reset(dut)
 
     # Program to test invalid CSR access:
     instr_mem = [
@@ -270,8 +248,9 @@ async def test_csr_invalid_access(dut):
     await run_csr_test_program(dut, instr_mem)
     
     # Verify invalid CSR returns 0
-    invalid_csr_value = int(dut.rf_inst0.register_file[2].value)
-    valid_csr_value = int(dut.rf_inst0.register_file[4].value)
+    register_file = dut.rf_inst0.register_file
+    invalid_csr_value = int(register_file[2].value)
+    valid_csr_value = int(register_file[4].value)
     
     print(f"Invalid CSR read: {invalid_csr_value:#x}")
     print(f"Valid CSR read: {valid_csr_value:#x}")
@@ -280,25 +259,8 @@ async def test_csr_invalid_access(dut):
     
     print("Invalid CSR access test passed!")
 
-from cocotb_test.simulator import run
-import os
 
 def runCocotbTests():
-    # All Verilog sources under rtl directory and subdirectories
-    sources = []
-    root_dir = os.getcwd()
-    while not os.path.exists(os.path.join(root_dir, "rtl")):
-        if os.path.dirname(root_dir) == root_dir:
-            raise FileNotFoundError("rtl directory not found in the current or parent directories.")
-        root_dir = os.path.dirname(root_dir)
-    print(f"Using RTL directory: {root_dir}/rtl")
-    rtl_dir = os.path.join(root_dir, "rtl")
-    incl_dir = os.path.join(rtl_dir, "include")
-    for root, _, files in os.walk(rtl_dir):
-        for file in files:
-            if file.endswith(".v") or file.endswith(".sv"):
-                sources.append(os.path.join(root, file))
-    
     # Define the CSR tests
     tests = [
         "test_csr_basic_operations",
@@ -307,30 +269,10 @@ def runCocotbTests():
         "test_csr_invalid_access",
     ]
     
-    # Create waveforms directory in the current working directory if it doesn't exist
-    curr_dir = os.getcwd()
-    waveform_dir = os.path.join(curr_dir, "waveforms")
-    if not os.path.exists(waveform_dir):
-        os.makedirs(waveform_dir)
-    # Query full path of the directory
-    waveform_dir = os.path.abspath("waveforms")
-    
-    # Run each test with its own waveform file
-    for test_name in tests:
-        print(f"\n=== Running {test_name} ===")
-        waveform_path = os.path.join(waveform_dir, f"{test_name}.vcd")
-        
-        # Use +dumpfile argument to pass the filename to the simulator
-        run(
-            verilog_sources=sources,
-            toplevel="riscv_cpu",
-            module="test_csr",
-            testcase=test_name,
-            includes=[str(incl_dir)],
-            simulator="icarus",
-            timescale="1ns/1ps",
-            plus_args=[f"+dumpfile={waveform_path}"]
-        )
+    # Run all CSR tests in a single simulator process, sharing the Icarus build of
+    # riscv_cpu with test_riscv_cpu_basic; each test resets the CPU and every
+    # program writes the registers it checks, so no state carries over
+    run_cocotb("test_csr", "riscv_cpu", tests, "sim_build_cpu_icarus", waves=WAVES)
 
 if __name__ == "__main__":
-    runCocotbTests()
\ No newline at end of file
+    runCocotbTests()
@@ -1,6 +1,8 @@
 import cocotb
-from cocotb.triggers import RisingEdge, Timer, ClockCycles
+from cocotb.triggers import RisingEdge, Timer, ClockCycles, First
+from cocotb.utils import get_sim_time
 from cocotb.clock import Clock
+from cpu_test_utils import SIM_DIR, run_cocotb, waveform_plusargs
 import subprocess
 import os
 import tempfile
@@ -20,24 +22,13 @@ def compile_fibonacci():
     """Compile fibonacci.c to RISC-V binary and prepare hex file for instruction memory"""
     log.info("Compiling fibonacci.c to RISC-V binary...")
     
-    # Get repository root directory
-    root_dir = os.getcwd()
-    while not os.path.exists(os.path.join(root_dir, "rtl")):
-        if os.path.dirname(root_dir) == root_dir:
-            raise FileNotFoundError("rtl directory not found in the current or parent directories.")
-        root_dir = os.path.dirname(root_dir)
-    print(f"Using RTL directory: {root_dir}/rtl")
-    rtl_dir = os.path.join(root_dir, "rtl")
-    sim_dir = os.path.join(root_dir, "sim")
-    
     # Create build directory if it doesn't exist in current working directory
     curr_dir = Path.cwd()
     build_dir = curr_dir / "build"
     build_dir.mkdir(exist_ok=True)
     
     # Source files
-    sim_dir = Path(sim_dir)
-    sim_dir = sim_dir.resolve()
+    sim_dir = Path(SIM_DIR)
     fibonacci_c = sim_dir / "fibonacci.c"
     start_s = sim_dir / "start.S"
     link_ld = sim_dir / "link.ld"
@@ -152,60 +143,32 @@ async def test_fibonacci_program(dut):
     
     # Reset the design
     dut.rst.value = 1
-    await ClockCycles(dut.clk, 5)
+    await ClockCycles(dut.clk, 2)
     dut.rst.value = 0
     
     # Expected Fibonacci sequence for N=10
     expected_sequence = [1, 1, 2, 3, 5, 8, 13, 21, 34, 55]
     
-    # Monitor for CPU_DONE signal
+    # Wait for the CPU_DONE strobe from top.v instead of sampling the memory
+    # bus every cycle; max_cycles only bounds the wait. The bound is a single
+    # Timer rather than ClockCycles, which wakes Python on every clock edge
     max_cycles = 10000  # Maximum cycles to run before timeout
-    cpu_done = False
-    data_values = []
-    
-    # Track memory accesses
-    mem_accesses = {}
-    
-    for cycle in range(max_cycles):
-        await RisingEdge(dut.clk)
-        
-        # Check for memory writes
-        if dut.cpu_mem_write_en.value:
-            addr = int(dut.cpu_mem_write_addr.value)
-            data = int(dut.cpu_mem_write_data.value)
-            mem_accesses[addr] = data
-            log.info(f"Cycle {cycle}: Memory write: addr=0x{addr:08x}, data=0x{data:08x}")
-            
-            # Check if CPU_DONE flag was set
-            if addr == CPU_DONE_ADDR and (data & 0xFF) == 1:
-                cpu_done = True
-                log.info("CPU_DONE flag set - program finished execution")
-                
-            # Collect Fibonacci sequence values (byte writes)
-            if FIBONACCI_START_ADDR <= addr < FIBONACCI_START_ADDR + 10:
-                index = addr - FIBONACCI_START_ADDR
-                value = data & 0xFF  # Extract lowest byte for byte writes
-                if index < len(data_values):
-                    data_values[index] = value
-                else:
-                    # Extend list if needed
-                    while len(data_values) <= index:
-                        data_values.append(0)
-                    data_values[index] = value
-                log.info(f"Fibonacci[{index}] = {value}")
-        
-        # Exit simulation once CPU_DONE is set and we've collected all values
-        if cpu_done and len([x for x in data_values if x != 0]) >= 10:
-            break
+    start_time = get_sim_time(units="ns")
+    done_trigger = RisingEdge(dut.cpu_done)
+    result = await First(done_trigger, Timer(max_cycles * 10, units="ns"))
+    cpu_done = result is done_trigger
+    cycles = int((get_sim_time(units="ns") - start_time) // 10)
+    if cpu_done:
+        log.info("CPU_DONE flag set - program finished execution")
+    
+    # Read the Fibonacci sequence (byte writes) back from data memory once
+    data_ram = dut.data_mem_inst.data_ram
+    fib_offset = FIBONACCI_START_ADDR - DATA_MEM_BASE
+    data_values = [int(data_ram[fib_offset + i].value) for i in range(len(expected_sequence))]
     
     # Verify results
-    log.info(f"Program execution complete after {cycle+1} cycles")
-    log.info(f"Collected Fibonacci values: {data_values[:10]}")
-    
-    # Dump memory accesses for debugging
-    print("Memory accesses:")
-    for addr, data in sorted(mem_accesses.items()):
-        print(f"  0x{addr:08x}: 0x{data:08x}")
+    log.info(f"Program execution complete after {cycles} cycles")
+    log.info(f"Collected Fibonacci values: {data_values}")
     
     # Check if CPU_DONE was set
     assert cpu_done, "CPU_DONE flag was not set - program did not complete"
@@ -221,47 +184,15 @@ async def test_fibonacci_program(dut):
 
 def runCocotbTests():
     """Run the cocotb test via cocotb-test"""
-    from cocotb_test.simulator import run
-    import os
-    
     # Compile the Fibonacci program
     hex_file = compile_fibonacci()
-
-    # Get repository root directory
-    curr_dir = os.getcwd()
-    root_dir = curr_dir
-    while not os.path.exists(os.path.join(root_dir, "rtl")):
-        if os.path.dirname(root_dir) == root_dir:
-            raise FileNotFoundError("rtl directory not found in the current or parent directories.")
-        root_dir = os.path.dirname(root_dir)
-    print(f"Using RTL directory: {root_dir}/rtl")
-    rtl_dir = os.path.join(root_dir, "rtl")
-    incl_dir = os.path.join(rtl_dir, "include")
-    
-    # Collect all Verilog sources
-    sources = []
-    rtl_dir = Path(rtl_dir)
-    for file in rtl_dir.glob("**/*.v"):
-        sources.append(str(file))
-    
-    # Create waveforms directory
-    curr_dir = Path(curr_dir)
-    waveform_dir = curr_dir / "waveforms"
-    waveform_dir.mkdir(exist_ok=True)
-    waveform_path = waveform_dir / "fibonacci_test.vcd"
     
-    # Run the test - pass hex file as a define instead of a parameter
-    run(
-        verilog_sources=sources,
-        toplevel="top",
-        module="test_fibonacci",
-        testcase="test_fibonacci_program",
-        includes=[str(incl_dir)],
-        simulator="icarus",
-        timescale="1ns/1ps",
-        plus_args=[f"+dumpfile={waveform_path}"],
-        defines=[f"INSTR_HEX_FILE=\"{hex_file}\""]  # Pass as Verilog define
+    # The program is passed as a plusarg so the build of top is shared with the
+    # other system tests that target top
+    run_cocotb(
+        "test_fibonacci", "top", ["test_fibonacci_program"], "sim_build_top",
+        plus_args=[f"+instr_hex={hex_file}"] + waveform_plusargs("fibonacci_test"),
     )
 
 if __name__ == "__main__":
-    runCocotbTests()
\ No newline at end of file
+    runCocotbTests()
@@ -1,23 +1,13 @@
 import cocotb
-from cocotb.triggers import RisingEdge, Timer
-from cocotb.clock import Clock
+from cocotb.triggers import RisingEdge
+from cpu_test_utils import WAVES, run_cocotb, start_clock_and_reset, check_register_values
 import pytest
 
 @cocotb.test()
 async def test_riscv_cpu_raw_hazards(dut):
     """Test for RAW hazards - when an instruction needs register data from previous instructions"""
     print("Starting RAW hazards test...")
-    # Attach a clock
-    clock = Clock(dut.clk, 10, units="ns")
-    cocotb.start_soon(clock.start())
-
-    # Reset
-    dut.module_instr_in.value = 0
-    dut.module_read_data_in.value = 0
-    dut.rst.value = 1
-    await Timer(20, units="ns")
-    dut.rst.value = 0
-    await RisingEdge(dut.clk)
+    await start_clock_and_reset(dut)
 
     # Program with multiple back-to-back RAW hazards:
     # 1. Simple RAW case: x1 <- x2 <- x3
@@ -47,10 +37,7 @@ async def test_riscv_cpu_raw_hazards(dut):
     
     # Verify register values
     print("\nVerifying register values:")
-    for reg, expected in expected_values.items():
-        actual = int(dut.rf_inst0.register_file[reg].value)
-        print(f"x{reg}: expected={expected:#x}, actual={actual:#x}")
-        assert actual == expected, f"Register x{reg} value mismatch: expected {expected:#x}, got {actual:#x}"
+    check_register_values(dut, expected_values)
     
     print("All register values match expected values - RAW hazard test passed!")
 
@@ -58,17 +45,7 @@ async def test_riscv_cpu_raw_hazards(dut):
 async def test_riscv_cpu_control_hazards(dut):
     """Test for control hazards - when branches and jumps affect the pipeline"""
     print("Starting control hazards test...")
-    # Attach a clock
-    clock = Clock(dut.clk, 10, units="ns")
-    cocotb.start_soon(clock.start())
-
-    # Reset
-    dut.module_instr_in.value = 0
-    dut.module_read_data_in.value = 0
-    dut.rst.value = 1
-    await Timer(20, units="ns")
-    dut.rst.value = 0
-    await RisingEdge(dut.clk)
+    await start_clock_and_reset(dut)
 
     # Program with branch and jump instructions:
     instr_mem = [
@@ -94,10 +71,7 @@ async def test_riscv_cpu_control_hazards(dut):
         3: 0,     # x3 = 0 (after branch)
     }
     print("\nVerifying register values:")
-    for reg, expected in expected_values.items():
-        actual = int(dut.rf_inst0.register_file[reg].value)
-        print(f"x{reg}: expected={expected:#x}, actual={actual:#x}")
-        assert actual == expected, f"Register x{reg} value mismatch: expected {expected:#x}, got {actual:#x}"
+    check_register_values(dut, expected_values)
 
     print("All register values match expected values - control hazards test passed!")
 
@@ -105,17 +79,7 @@ async def test_riscv_cpu_control_hazards(dut):
 async def test_riscv_cpu_memory_hazards(dut):
     """Test for memory hazards - particularly store-load hazards"""
     print("Starting memory hazards test...")
-    # Attach a clock
-    clock = Clock(dut.clk, 10, units="ns")
-    cocotb.start_soon(clock.start())
-
-    # Reset
-    dut.module_instr_in.value = 0
-    dut.module_read_data_in.value = 0
-    dut.rst.value = 1
-    await Timer(20, units="ns")
-    dut.rst.value = 0
-    await RisingEdge(dut.clk)
+    await start_clock_and_reset(dut)
 
     # Memory data for loads
     mem_data = {}  # address -> data
@@ -131,45 +95,48 @@ async def test_riscv_cpu_memory_hazards(dut):
         0x00312103,  # lw x2, 3(x2)        # x2 = MEM[3] (misaligned load)
     ]
 
-    # Simulate data memory - handle read requests
-    async def handle_memory_writes(dut, mem_data):
-        while True:
-            # Check for memory read and respond in the same cycle
-            try:
-                if int(dut.module_mem_wr_en.value):
-                    addr = int(dut.module_write_addr.value)
-                    data = int(dut.module_wr_data_out.value)
-                    print(f"Memory write: MEM[{addr:#x}] = {data:#x}")
-                    mem_data[addr] = data
-            except Exception as e:
-                print(f"Memory handler error: {e}")
-            
-            # Wait for next clock cycle after handling the current one
-            await RisingEdge(dut.clk)
-
-    async def handle_memory_reads(dut, mem_data):
-        while True:
-            # Check for memory read requests
-            try:
-                if int(dut.module_mem_rd_en.value):
-                    addr = int(dut.module_read_addr.value)
-                    if addr in mem_data:
-                        data = mem_data[addr]
-                        dut.module_read_data_in.value = data
-                        print(f"Memory read: MEM[{addr:#x}] = {data:#x}")
-                    else:
-                        dut.module_read_data_in.value = 0xDEADBEEF  # Default value if not found
-            except Exception as e:
-                print(f"Memory handler error: {e}")
-            # Wait for next clock cycle after handling the current one
-            await RisingEdge(dut.clk)
-    
-    # Start the memory handler
-    cocotb.start_soon(handle_memory_writes(dut, mem_data))
-    cocotb.start_soon(handle_memory_reads(dut, mem_data))
+    # Start the data memory model
+    cocotb.start_soon(data_memory_model(dut, mem_data))
     
     await run_test_program(dut, instr_mem)
 
+async def data_memory_model(dut, mem_data):
+    """Background data memory: services the core's store and load ports once per clock"""
+    clk_edge = RisingEdge(dut.clk)
+    mem_wr_en = dut.module_mem_wr_en
+    write_addr = dut.module_write_addr
+    wr_data_out = dut.module_wr_data_out
+    mem_rd_en = dut.module_mem_rd_en
+    read_addr = dut.module_read_addr
+    read_data_in = dut.module_read_data_in
+
+    while True:
+        # Handle memory writes
+        try:
+            if int(mem_wr_en.value):
+                addr = int(write_addr.value)
+                data = int(wr_data_out.value)
+                print(f"Memory write: MEM[{addr:#x}] = {data:#x}")
+                mem_data[addr] = data
+        except Exception as e:
+            print(f"Memory handler error: {e}")
+
+        # Handle memory read requests, responding in the same cycle
+        try:
+            if int(mem_rd_en.value):
+                addr = int(read_addr.value)
+                if addr in mem_data:
+                    data = mem_data[addr]
+                    read_data_in.value = data
+                    print(f"Memory read: MEM[{addr:#x}] = {data:#x}")
+                else:
+                    read_data_in.value = 0xDEADBEEF  # Default value if not found
+        except Exception as e:
+            print(f"Memory handler error: {e}")
+
+        # Wait for next clock cycle after handling the current one
+        await clk_edge
+
 async def run_test_program(dut, instr_mem):
     """Helper function to run a program and track register values"""
     # Dictionary to track register values
@@ -184,13 +151,32 @@ async def run_test_program(dut, instr_mem):
     
     # Pipeline stages tracker
     pipeline_tracker = []
+
+    # Bind the fetch handles once; the instruction bus is only re-driven when
+    # the fetched word changes, so stalled cycles don't schedule a write
+    pc_out = dut.module_pc_out
+    instr_in = dut.module_instr_in
+    driven_instr = None
+
+    # Resolve the monitored handles once instead of on every cycle
+    rd_in = dut.rf_inst0_rd_in
+    rd_value_in = dut.rf_inst0_rd_value_in
+    wr_en = dut.rf_inst0_wr_en
+    forward_a_sig = dut.forward_a
+    forward_b_sig = dut.forward_b
+    stall_sig = dut.stall_pipeline
+    flush_sig = dut.branch_flush
+    store_load_hazard_sig = dut.store_load_hazard
+    clk_edge = RisingEdge(dut.clk)
     
     # Feed instructions and track pipeline stages
     for cycle in range(30):  # Run for enough cycles
         # Feed instruction based on PC
-        pc = int(dut.module_pc_out.value)
+        pc = int(pc_out.value)
         current_instr = get_instr(pc)
-        dut.module_instr_in.value = current_instr
+        if current_instr != driven_instr:
+            instr_in.value = current_instr
+            driven_instr = current_instr
         
         # Track what's in each pipeline stage
         if current_instr != 0:
@@ -202,55 +188,45 @@ async def run_test_program(dut, instr_mem):
                 'instr': current_instr
             })
         
-        # Track register writes
+        # Track register writes; the destination and value are only read
+        # on cycles that actually write back
         try:
-            wb_reg = int(dut.rf_inst0_rd_in.value)
-            wb_val = int(dut.rf_inst0_rd_value_in.value)
-            wb_en = int(dut.rf_inst0_wr_en.value)
-            
-            if wb_en and wb_reg != 0:
-                reg_values[wb_reg] = wb_val
-                print(f"Cycle {cycle}: Register x{wb_reg} = {wb_val:#x}")
+            if int(wr_en.value):
+                wb_reg = int(rd_in.value)
+                if wb_reg != 0:
+                    wb_val = int(rd_value_in.value)
+                    reg_values[wb_reg] = wb_val
+                    print(f"Cycle {cycle}: Register x{wb_reg} = {wb_val:#x}")
         except Exception as e:
             print(f"Error tracking registers: {e}")
         
-        # Print hazard detection signals
+        # Print hazard detection signals, snapshotted once per cycle
         try:
+            forward_a, forward_b, stall, flush, store_load_hazard = (
+                int(forward_a_sig.value),
+                int(forward_b_sig.value),
+                int(stall_sig.value),
+                int(flush_sig.value),
+                int(store_load_hazard_sig.value),
+            )
+            
             # RAW hazard detection (forwarding unit)
-            forward_a = int(dut.forward_a.value)
-            forward_b = int(dut.forward_b.value)
             if forward_a > 0 or forward_b > 0:
                 print(f"Cycle {cycle}: RAW hazard detected - forward_a={forward_a}, forward_b={forward_b}")
-                
             # Load-use hazard detection
-            try:
-                stall = int(dut.stall_pipeline.value)
-                if stall:
-                    print(f"Cycle {cycle}: Load-use hazard detected - pipeline stalled")
-            except Exception:
-                pass
-                
+            if stall:
+                print(f"Cycle {cycle}: Load-use hazard detected - pipeline stalled")
             # Branch/jump hazard detection
-            try:
-                flush = int(dut.branch_flush.value)
-                if flush:
-                    print(f"Cycle {cycle}: Branch hazard detected - pipeline flushed")
-            except Exception:
-                pass
-                
+            if flush:
+                print(f"Cycle {cycle}: Branch hazard detected - pipeline flushed")
             # Store-load hazard detection
-            try:
-                store_load_hazard = int(dut.store_load_hazard.value)
-                if store_load_hazard:
-                    print(f"Cycle {cycle}: Store-load hazard detected")
-            except Exception:
-                pass
-                
+            if store_load_hazard:
+                print(f"Cycle {cycle}: Store-load hazard detected")
         except Exception as e:
             print(f"Error checking hazard signals: {e}")
             
         # Advance simulation
-        await RisingEdge(dut.clk)
+        await clk_edge
         
     # Print final register values
     print("\nFinal register values:")
@@ -258,56 +234,34 @@ async def run_test_program(dut, instr_mem):
         if value != 0:  # Only print non-zero registers
             print(f"x{reg} = {value:#x}")
 
-from cocotb_test.simulator import run
 import os
 
+# The CPU tests
+CPU_TESTS = [
+    "test_riscv_cpu_raw_hazards",
+    "test_riscv_cpu_control_hazards", 
+    "test_riscv_cpu_memory_hazards"
+]
+
 def runCocotbTests():
-    # All Verilog sources under rtl directory and subdirectories
-    sources = []
-    root_dir = os.getcwd()
-    while not os.path.exists(os.path.join(root_dir, "rtl")):
-        if os.path.dirname(root_dir) == root_dir:
-            raise FileNotFoundError("rtl directory not found in the current or parent directories.")
-        root_dir = os.path.dirname(root_dir)
-    print(f"Using RTL directory: {root_dir}/rtl")
-    rtl_dir = os.path.join(root_dir, "rtl")
-    for root, _, files in os.walk(rtl_dir):
-        for file in files:
-            if file.endswith(".v") or file.endswith(".sv"):
-                sources.append(os.path.join(root, file))
-    incl_dir = os.path.join(rtl_dir, "include")
-    
-    # Define the tests
-    tests = [
-        "test_riscv_cpu_raw_hazards",
-        "test_riscv_cpu_control_hazards", 
-        "test_riscv_cpu_memory_hazards"
-    ]
+    """Run all CPU tests in a single simulator process"""
+    # Simulator backend, selectable with e.g. SIM=verilator (defaults to Icarus)
+    sim = os.environ.get("SIM", "icarus")
+    # Build an optimised, multi-threaded model when running under Verilator. Use
+    # up to 4 threads, but only one per model when pytest-xdist already runs a
+    # simulator on every core
+    extra_args = []
+    if sim == "verilator":
+        threads = 1 if os.environ.get("PYTEST_XDIST_WORKER") else min(4, os.cpu_count() or 1)
+        extra_args = ["--threads", str(threads), "-O3", "--x-assign", "fast", "--x-initial", "fast", "--noassert"]
     
-    # Create waveforms directory in the current working directory if it doesn't exist
-    curr_dir = os.getcwd()
-    waveform_dir = os.path.join(curr_dir, "waveforms")
-    if not os.path.exists(waveform_dir):
-        os.makedirs(waveform_dir)
-    # Query full path of the directory
-    waveform_dir = os.path.abspath("waveforms")
-    
-    # Run each test with its own waveform file
-    for test_name in tests:
-        print(f"\n=== Running {test_name} ===")
-        waveform_path = os.path.join(waveform_dir, f"{test_name}.vcd")
-        
-        # Use +dumpfile argument to pass the filename to the simulator
-        run(
-            verilog_sources=sources,
-            toplevel="riscv_cpu",
-            module="test_riscv_cpu_basic",
-            testcase=test_name,
-            includes=[str(incl_dir)],
-            simulator="icarus",
-            timescale="1ns/1ps",
-            plus_args=[f"+dumpfile={waveform_path}"]
-        )
+    # Each test resets the CPU and feeds its own program, so no state carries
+    # over between them. riscv_cpu has no dump code of its own, so waveforms
+    # come from the simulator
+    run_cocotb(
+        "test_riscv_cpu_basic", "riscv_cpu", CPU_TESTS, f"sim_build_cpu_{sim}",
+        simulator=sim, extra_args=extra_args, waves=WAVES,
+    )
 
 if __name__ == "__main__":
     runCocotbTests()
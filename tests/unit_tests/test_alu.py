@@ -1,6 +1,7 @@
 import cocotb
 from cocotb.triggers import Timer
 import random
+import numpy as np
 import os
 from pathlib import Path
 
@@ -22,10 +23,9 @@ async def verify_alu_operation(dut, rs1, rs2, imm, instruction, pc_input, expect
         f"expected=0x{expected_output:08x}, got=0x{actual_output:08x}"
     )
     
-    dut._log.info(
-        f"ALU operation {operation_name} passed: "
-        f"rs1=0x{rs1:08x}, rs2=0x{rs2:08x}, imm=0x{imm:08x}, "
-        f"result=0x{actual_output:08x}"
+    dut._log.debug(
+        "ALU operation %s passed: rs1=0x%08x, rs2=0x%08x, imm=0x%08x, result=0x%08x",
+        operation_name, rs1, rs2, imm, actual_output
     )
 
 # Basic operations with R-type instructions
@@ -152,14 +152,18 @@ async def test_default(dut):
 @cocotb.test()
 async def test_random_inputs(dut):
     """Test random inputs for all operations"""
-    for _ in range(10):  # Run 10 random tests
-        #generate rs1, rs2, imm, betweeen 0 to 2^32-1
-        rs1 = random.randint(0, 0xFFFFFFFF)
-        rs2 = random.randint(0, 0xFFFFFFFF)
-        imm = random.randint(0, 0xFFFFFFFF)
-        pc_input = random.randint(0, 0xFFFFFFFF)
-        instr = random.randint(1, 0x13)
-        
+    num_tests = 10  # Run 10 random tests
+    # Generate all rs1, rs2, imm, pc_input values (0 to 2^32-1) and instructions up
+    # front; seeding from `random` keeps runs reproducible under cocotb's RANDOM_SEED
+    rng = np.random.default_rng(random.getrandbits(32))
+    operands = rng.integers(0, 1 << 32, size=(num_tests, 4), dtype=np.uint32)
+    # Sign-extended views for the signed compares and arithmetic shifts,
+    # reinterpreted in one go rather than per value
+    signed_operands = operands.view(np.int32).tolist()
+    operands = operands.tolist()
+    instrs = rng.integers(1, 0x13, size=num_tests, endpoint=True).tolist()
+    
+    for (rs1, rs2, imm, pc_input), (rs1_signed, rs2_signed, imm_signed, _), instr in zip(operands, signed_operands, instrs):
         # Calculate expected result based on instruction
         if instr == 0x1:  # ADD
             expected = (rs1 + rs2) & 0xFFFFFFFF
@@ -177,11 +181,8 @@ async def test_random_inputs(dut):
             expected = (rs1 >> (rs2 & 0x1F)) & 0xFFFFFFFF
         elif instr == 0x8:  # SRA
             # Python's >> is arithmetic for signed integers
-            rs1_signed = rs1 if rs1 < 0x80000000 else rs1 - 0x100000000
             expected = ((rs1_signed >> (rs2 & 0x1F)) & 0xFFFFFFFF)
         elif instr == 0x9:  # SLT
-            rs1_signed = rs1 if rs1 < 0x80000000 else rs1 - 0x100000000
-            rs2_signed = rs2 if rs2 < 0x80000000 else rs2 - 0x100000000
             expected = 0xFFFFFFFF if rs1_signed < rs2_signed else 0
         elif instr == 0xA:  # SLTU
             expected = 0xFFFFFFFF if rs1 < rs2 else 0
@@ -198,11 +199,8 @@ async def test_random_inputs(dut):
         elif instr == 0x10:  # SRLI
             expected = (rs1 >> (imm & 0x1F)) & 0xFFFFFFFF
         elif instr == 0x11:  # SRAI
-            rs1_signed = rs1 if rs1 < 0x80000000 else rs1 - 0x100000000
             expected = ((rs1_signed >> (imm & 0x1F)) & 0xFFFFFFFF)
         elif instr == 0x12:  # SLTI
-            rs1_signed = rs1 if rs1 < 0x80000000 else rs1 - 0x100000000
-            imm_signed = imm if imm < 0x80000000 else imm - 0x100000000
             expected = 0xFFFFFFFF if rs1_signed < imm_signed else 0
         elif instr == 0x13:  # SLTIU
             expected = 0xFFFFFFFF if rs1 < imm else 0
@@ -210,26 +208,27 @@ async def test_random_inputs(dut):
         await verify_alu_operation(dut, rs1, rs2, imm, instr, pc_input, expected, f"Random test instr=0x{instr:x}")
 
 import pytest
-from cocotb_test.simulator import run
 import os
 
+# RTL paths are resolved once at import, relative to this file
+RTL_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "rtl"))
+INCL_DIR = os.path.join(RTL_DIR, "include")
+ALU_PATH = os.path.join(RTL_DIR, "core_modules", "alu.v")
+
 def runCocotbTests():
     """Run all tests"""
-    # Define the test directory and files
-    root_dir = os.getcwd()
-    while not os.path.exists(os.path.join(root_dir, "rtl")):
-        if os.path.dirname(root_dir) == root_dir:
-            raise FileNotFoundError("rtl directory not found in the current or parent directories.")
-        root_dir = os.path.dirname(root_dir)
-    print(f"Using RTL directory: {root_dir}/rtl")
-    rtl_dir = os.path.join(root_dir, "rtl")
-    incl_dir = os.path.join(rtl_dir, "include")
-    verilog_file = os.path.join(rtl_dir, "core_modules", "alu.v")
-    
+    # Imported here so the simulator-side import of this module skips cocotb_test
+    from cocotb_test.simulator import run
+    print(f"Using RTL directory: {RTL_DIR}")
+    # Each pytest-xdist worker builds into its own directory
+    worker = os.environ.get("PYTEST_XDIST_WORKER", "")
     run(
-        verilog_sources=[verilog_file],
+        verilog_sources=[ALU_PATH],
         toplevel="alu",
         module="test_alu",
         simulator="verilator",
-        includes=[incl_dir]
+        sim_build=os.path.join(os.getcwd(), "sim_build", f"sim_build_alu{worker}"),
+        includes=[INCL_DIR],
+        # Optimised model; X-propagation and assertions are not needed here
+        extra_args=["-O3", "--x-assign", "fast", "--x-initial", "fast", "--noassert"],
     )
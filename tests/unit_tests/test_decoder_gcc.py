@@ -24,25 +24,23 @@ def assemble_riscv_instruction(assembly_code, bin_file="temp.bin"):
     os.remove("temp.o")
     os.remove("temp.elf")
 
-def encode_instruction(instruction):
-    if isinstance(instruction, str):
-        # single-line case
-        assembly_code = f"""
-        .section .text
-        .globl _start
-        _start:
-            {instruction}
-        """
-    else:
-        # multiline block
-        assembly_code = instruction[0]
+def encode_instructions(instructions):
+    """Assemble a batch of single-instruction lines in one toolchain run.
+
+    Branch/jump targets must be PC-relative (e.g. `.+8`) since every
+    instruction is laid out back-to-back in the same .text section.
+    """
+    assembly_code = ".section .text\n.globl _start\n_start:\n"
+    assembly_code += "".join(f"    {instr}\n" for instr in instructions)
 
     bin_file = "temp.bin"
     assemble_riscv_instruction(assembly_code, bin_file)
     with open(bin_file, "rb") as f:
-        encoded_instr = int.from_bytes(f.read(4), byteorder="little")
+        data = f.read()
     os.remove(bin_file)
-    return encoded_instr
+
+    assert len(data) == 4 * len(instructions), "Expected exactly one 32-bit word per instruction"
+    return [int.from_bytes(data[i:i + 4], byteorder="little") for i in range(0, len(data), 4)]
 
 
 """
@@ -62,9 +60,10 @@ Instructions tested:
 - J-type: jal
 - U-type: lui
 
-Each instruction is encoded using the `encode_instruction` function, and the 
-resulting binary is applied to the `dut.instr` signal. The test then waits for 
-10 ns and checks that the decoded fields in the DUT match the expected values.
+All instructions are assembled up front in a single `encode_instructions`
+call, and each resulting word is applied to the `dut.instr` signal. The test
+then waits for 10 ns and checks that the decoded fields in the DUT match the
+expected values.
 
 Assertions:
 - `dut.opcode.value` matches the expected opcode.
@@ -85,56 +84,58 @@ async def test_decoder_exhaustive(dut):
         ("addi x7, x8, 10", {"opcode": 0b0010011, "rs1": 8, "rs2": 0, "rd": 7, "instr_id": 0x0B, "imm": 10}),
         ("lw x9, 0(x10)", {"opcode": 0b0000011, "rs1": 10, "rs2": 0, "rd": 9, "instr_id": 0x16, "imm": 0}),
         ("sw x11, 4(x12)", {"opcode": 0b0100011, "rs1": 12, "rs2": 11, "rd": 0, "instr_id": 0x1B, "imm": 4}),
-        ("""
-        .section .text
-        .globl _start
-        _start:
-            beq x13, x14, target
-            nop
-        target:
-        """, {"opcode": 0b1100011, "rs1": 13, "rs2": 14, "rd": 0, "instr_id": 0x1C, "imm": 8}),
-        ("jal x15, 16", {"opcode": 0b1101111, "rs1": 0, "rs2": 0, "rd": 15, "instr_id": 0x22, "imm": 16}),
+        ("beq x13, x14, .+8", {"opcode": 0b1100011, "rs1": 13, "rs2": 14, "rd": 0, "instr_id": 0x1C, "imm": 8}),
+        ("jal x15, .+16", {"opcode": 0b1101111, "rs1": 0, "rs2": 0, "rd": 15, "instr_id": 0x22, "imm": 16}),
         ("lui x16, 0x12345", {"opcode": 0b0110111, "rs1": 0, "rs2": 0, "rd": 16, "instr_id": 0x24, "imm": 0x12345000}),
         # Add fence.i test
         ("fence.i", {"opcode": 0b0001111, "rs1": 0, "rs2": 0, "rd": 0, "instr_id": 0x26, "imm": 0}),
     ]
 
-    for instr, expected in instructions:
-        encoded = encode_instruction(instr)
-        dut.instr.value = encoded
-        await Timer(10, units="ns")
-
-        assert dut.opcode.value == expected["opcode"], f"{instr}: opcode mismatch"
-        assert dut.rs1.value == expected.get("rs1", 0), f"{instr}: rs1 mismatch"
-        assert dut.rs2.value == expected.get("rs2", 0), f"{instr}: rs2 mismatch"
-        assert dut.rd.value == expected.get("rd", 0), f"{instr}: rd mismatch"
+    encodings = encode_instructions([instr for instr, _ in instructions])
+
+    # Resolve the decoder ports once rather than on every instruction
+    instr_in = dut.instr
+    opcode = dut.opcode
+    rs1 = dut.rs1
+    rs2 = dut.rs2
+    rd = dut.rd
+    imm = dut.imm
+    instr_id = dut.instr_id
+    settle = Timer(10, units="ns")
+
+    for (instr, expected), encoded in zip(instructions, encodings):
+        instr_in.value = encoded
+        await settle
+
+        assert int(opcode.value) == expected["opcode"], f"{instr}: opcode mismatch"
+        assert int(rs1.value) == expected.get("rs1", 0), f"{instr}: rs1 mismatch"
+        assert int(rs2.value) == expected.get("rs2", 0), f"{instr}: rs2 mismatch"
+        assert int(rd.value) == expected.get("rd", 0), f"{instr}: rd mismatch"
         if "imm" in expected:
-            assert dut.imm.value == expected["imm"], f"{instr}: imm mismatch"
-        assert dut.instr_id.value.integer == expected["instr_id"], f"{instr}: instr_id mismatch"
+            assert int(imm.value) == expected["imm"], f"{instr}: imm mismatch"
+        assert int(instr_id.value) == expected["instr_id"], f"{instr}: instr_id mismatch"
 
 import pytest
-from cocotb_test.simulator import run
+
+# RTL paths are resolved once at import, relative to this file
+RTL_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "rtl"))
+INCL_DIR = os.path.join(RTL_DIR, "include")
+DECODER_PATH = os.path.join(RTL_DIR, "core_modules", "decoder.v")
 
 def runCocotbTests():
     """Run all tests"""
-
-    root_dir = os.getcwd()
-    while not os.path.exists(os.path.join(root_dir, "rtl")):
-        if os.path.dirname(root_dir) == root_dir:
-            raise FileNotFoundError("rtl directory not found in the current or parent directories.")
-        root_dir = os.path.dirname(root_dir)
-    print(f"Using RTL directory: {root_dir}/rtl")
-    rtl_dir = os.path.join(root_dir, "rtl")
-    incl_dir = os.path.join(rtl_dir, "include")
-    instr_defines_file = os.path.join(rtl_dir, "instr_defines.vh")
-    decoder_file = os.path.join(rtl_dir, "core_modules", "decoder.v")
-
+    # Imported here so the simulator-side import of this module skips cocotb_test
+    from cocotb_test.simulator import run
+    print(f"Using RTL directory: {RTL_DIR}")
+    # Each pytest-xdist worker builds into its own directory
+    worker = os.environ.get("PYTEST_XDIST_WORKER", "")
     run(
-        verilog_sources=[
-            decoder_file        
-        ],
+        verilog_sources=[DECODER_PATH],
         toplevel="decoder",
         module="test_decoder_gcc",
         simulator="verilator",
-        includes=[str(incl_dir)],
-    )
\ No newline at end of file
+        sim_build=os.path.join(os.getcwd(), "sim_build", f"sim_build_decoder{worker}"),
+        includes=[INCL_DIR],
+        # Optimised model; X-propagation and assertions are not needed here
+        extra_args=["-O3", "--x-assign", "fast", "--x-initial", "fast", "--noassert"],
+    )